@@ -1,73 +1,210 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from twitchAPI.twitch import Twitch
-from twitchAPI.type import AuthScope
+from twitchAPI.type import AuthScope, TwitchResourceNotFound, UnauthorizedException
+from twitchAPI.eventsub.websocket import EventSubWebsocket
+from twitchAPI.helper import first
 import asyncio
 import os
-import json
+import orjson
+import aiosqlite
+from aiolimiter import AsyncLimiter
 import logging
-import traceback
-from typing import Optional, Dict
+import time
+from typing import Optional, Dict, Set, AsyncIterator
 from datetime import datetime
 from twitch_auth import TwitchAuthManager
 
 # Set up logging
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# discord.py logs every gateway event at DEBUG, keep it quiet unless asked for
+logging.getLogger('discord').setLevel(os.environ.get('DISCORD_LOG_LEVEL', 'WARNING').upper())
 
 # Configuration from GitHub Secrets
 TWITCH_CLIENT_ID = os.environ['TWITCH_CLIENT_ID']
 TWITCH_CLIENT_SECRET = os.environ['TWITCH_CLIENT_SECRET']
 DISCORD_TOKEN = os.environ['DISCORD_TOKEN']
 TWITCH_CHANNEL_NAME = os.environ['TWITCH_CHANNEL_NAME']
+TWITCH_CHANNEL_LOGIN = TWITCH_CHANNEL_NAME.lower()
 DISCORD_GUILD_ID = int(os.environ['DISCORD_GUILD_ID'])
 DISCORD_VIP_ROLE_ID = int(os.environ['DISCORD_VIP_ROLE_ID'])
 DISCORD_SUB_ROLE_ID = int(os.environ.get('DISCORD_SUB_ROLE_ID', 0))
+SUB_ENABLED = bool(DISCORD_SUB_ROLE_ID)
 DISCORD_MOD_CHANNEL_ID = int(os.environ.get('DISCORD_MOD_CHANNEL_ID', 0))
 
 # File paths
+VERIFIED_USERS_DB = 'verified_users.db'
+# Old JSON store, imported into the database once
 VERIFIED_USERS_FILE = 'verified_users.json'
 TOKEN_FILE = 'twitch_tokens.json'
 
-# Initialize Discord bot
-intents = discord.Intents.default()
-intents.message_content = True
+# How often roles are fully synced even if nobody asked for it, in seconds
+SYNC_INTERVAL = 24 * 60 * 60
+
+# Maximum number of role edits sent to Discord at once
+ROLE_UPDATE_CONCURRENCY = 5
+
+# How many times a rate limited or failed role edit is retried
+ROLE_UPDATE_RETRIES = 5
+
+# Helix allows 800 requests per minute, stay a little below that.
+# twitchAPI itself waits out a 429, this keeps bursts from getting there
+HELIX_REQUESTS_PER_MINUTE = 700
+
+# How long fetched VIP/subscriber lists are reused, in seconds
+TWITCH_CACHE_TTL = 120
+
+# While EventSub keeps the lists up to date they are only refetched as a safety net
+EVENTSUB_CACHE_TTL = 3600
+
+# Minimum time between two "Twitch auth missing" messages in the mod channel, in seconds
+AUTH_NOTIFY_INTERVAL = 3600
+
+# Initialize Discord bot with only the events it uses
+intents = discord.Intents.none()
+intents.guilds = True
 intents.members = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+intents.guild_messages = True
+# !link and !unlink are also used from DMs
+intents.dm_messages = True
+intents.message_content = True
+
+class EnteryBot(commands.Bot):
+    async def setup_hook(self):
+        # Runs before any gateway event is dispatched, so commands always find the database open
+        await open_verified_users_db()
+
+    async def close(self):
+        await stop_eventsub()
+        if twitch:
+            await twitch.close()
+        await super().close()
+        await close_verified_users_db()
+
+bot = EnteryBot(command_prefix='!', intents=intents)
 
 # Global variables
 twitch = None
 auth_manager = None
-verified_users: Dict[str, str] = {}
+eventsub: Optional[EventSubWebsocket] = None
+verified_users: Dict[int, str] = {}
+# Several Discord accounts may link the same Twitch login
+twitch_to_discord: Dict[str, Set[int]] = {}
+verified_db: Optional[aiosqlite.Connection] = None
 
-def load_verified_users():
-    global verified_users
-    try:
-        if os.path.exists(VERIFIED_USERS_FILE):
-            with open(VERIFIED_USERS_FILE, 'r') as f:
-                verified_users = json.load(f)
-            logger.info(f"Loaded {len(verified_users)} verified users")
-    except Exception as e:
-        logger.error(f"Error loading verified users: {e}")
-        verified_users = {}
+# Cached Twitch data
+channel_id_cache: Optional[str] = None
+# A fetched_at of None means the list was never fetched
+twitch_cache = {'vips': (None, set()), 'subs': (None, set())}
+twitch_cache_locks = {'vips': asyncio.Lock(), 'subs': asyncio.Lock()}
+last_auth_notify = 0.0
+helix_limiter = AsyncLimiter(HELIX_REQUESTS_PER_MINUTE, 60)
+
+# Role syncs are queued and run one at a time by sync_worker
+sync_queue: asyncio.Queue = asyncio.Queue()
+sync_worker_task: Optional[asyncio.Task] = None
 
-def save_verified_users():
+async def open_verified_users_db():
+    """Open the verified users database and load all links into memory"""
+    global verified_db, verified_users, twitch_to_discord
+    if verified_db is not None:
+        return
+    verified_db = await aiosqlite.connect(VERIFIED_USERS_DB)
+    await verified_db.execute("PRAGMA journal_mode=WAL")
+    await verified_db.execute(
+        "CREATE TABLE IF NOT EXISTS users (discord_id INTEGER PRIMARY KEY, twitch_username TEXT NOT NULL)"
+    )
+    await verified_db.commit()
+    await import_verified_users_file()
+
+    async with verified_db.execute("SELECT discord_id, twitch_username FROM users") as cursor:
+        # Logins are lowercased once here so lookups never have to
+        verified_users = {discord_id: twitch_username.lower() async for discord_id, twitch_username in cursor}
+    twitch_to_discord = {}
+    for discord_id, twitch_username in verified_users.items():
+        twitch_to_discord.setdefault(twitch_username, set()).add(discord_id)
+    logger.info("Loaded %d verified users", len(verified_users))
+
+async def import_verified_users_file():
+    """One-time import of links from the old JSON file into an empty database"""
+    if not os.path.exists(VERIFIED_USERS_FILE):
+        return
+    async with verified_db.execute("SELECT 1 FROM users LIMIT 1") as cursor:
+        if await cursor.fetchone():
+            return
     try:
-        with open(VERIFIED_USERS_FILE, 'w') as f:
-            json.dump(verified_users, f)
-        logger.info("Saved verified users to file")
+        with open(VERIFIED_USERS_FILE, 'rb') as f:
+            data = orjson.loads(f.read())
+        await verified_db.executemany(
+            "INSERT OR REPLACE INTO users (discord_id, twitch_username) VALUES (?, ?)",
+            ((int(discord_id), twitch_username.lower()) for discord_id, twitch_username in data.items())
+        )
+        await verified_db.commit()
+        logger.info("Imported %d verified users from %s", len(data), VERIFIED_USERS_FILE)
     except Exception as e:
-        logger.error(f"Error saving verified users: {e}")
+        logger.error("Error importing verified users: %s", e)
+
+async def close_verified_users_db():
+    global verified_db
+    if verified_db is not None:
+        await verified_db.close()
+        verified_db = None
+
+def remove_twitch_index(twitch_username, discord_id):
+    discord_ids = twitch_to_discord.get(twitch_username)
+    if discord_ids is not None:
+        discord_ids.discard(discord_id)
+        if not discord_ids:
+            del twitch_to_discord[twitch_username]
+
+async def link_verified_user(discord_id, twitch_username):
+    # Persist first so a failed write never leaves the in-memory maps ahead of the database
+    await verified_db.execute(
+        "INSERT OR REPLACE INTO users (discord_id, twitch_username) VALUES (?, ?)",
+        (discord_id, twitch_username)
+    )
+    await verified_db.commit()
+    previous = verified_users.get(discord_id)
+    if previous is not None:
+        remove_twitch_index(previous, discord_id)
+    verified_users[discord_id] = twitch_username
+    twitch_to_discord.setdefault(twitch_username, set()).add(discord_id)
+
+async def unlink_verified_user(discord_id):
+    twitch_username = verified_users.get(discord_id)
+    if twitch_username is None:
+        return None
+    await verified_db.execute("DELETE FROM users WHERE discord_id = ?", (discord_id,))
+    await verified_db.commit()
+    del verified_users[discord_id]
+    remove_twitch_index(twitch_username, discord_id)
+    return twitch_username
+
+async def notify_auth_missing():
+    """Ask the mods to re-run !setupauth, at most once per AUTH_NOTIFY_INTERVAL"""
+    global last_auth_notify
+    if not DISCORD_MOD_CHANNEL_ID:
+        return
+    now = time.monotonic()
+    if last_auth_notify and now - last_auth_notify < AUTH_NOTIFY_INTERVAL:
+        return
+    channel = bot.get_channel(DISCORD_MOD_CHANNEL_ID)
+    if channel:
+        last_auth_notify = now
+        await channel.send("⚠️ Je potřeba obnovit Twitch autorizaci! Použij příkaz `!setupauth`")
 
 async def initialize_twitch():
     global auth_manager, twitch
     try:
         logger.info("Attempting Twitch authentication...")
-        auth_manager = TwitchAuthManager(TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET, TWITCH_CHANNEL_NAME)
-        twitch_instance = await auth_manager.initialize()
+        # Reuse the existing manager, !setupauth/!completeauth may be in the middle of using its client
+        if auth_manager is None:
+            auth_manager = TwitchAuthManager(TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET, TWITCH_CHANNEL_NAME)
+        twitch_instance = auth_manager.twitch or await auth_manager.initialize()
         
         if twitch_instance:
             # Make sure we have valid user authentication
@@ -77,185 +214,461 @@ async def initialize_twitch():
                 return twitch_instance
             else:
                 logger.warning("Twitch API initialized but missing user authentication")
-                if DISCORD_MOD_CHANNEL_ID:
-                    channel = bot.get_channel(DISCORD_MOD_CHANNEL_ID)
-                    if channel:
-                        await channel.send("⚠️ Je potřeba obnovit Twitch autorizaci! Použij příkaz `!setupauth`")
+                await notify_auth_missing()
                 return None
         else:
             logger.error("Failed to initialize Twitch API")
             return None
             
     except Exception as e:
-        logger.error(f"Failed to initialize Twitch API: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception("Failed to initialize Twitch API: %s", e)
         return None
 
+async def get_twitch() -> Optional[Twitch]:
+    """Return the shared Twitch client, creating it only if there is none yet"""
+    global twitch
+    if twitch is None:
+        twitch = await initialize_twitch()
+    return twitch
+
+async def helix_pages(items: AsyncIterator, page_size=100, first_page_loaded=False) -> AsyncIterator:
+    """Iterate a paginated Helix result, taking one rate limit slot per page"""
+    count = 0
+    while True:
+        if count % page_size == 0 and not (count == 0 and first_page_loaded):
+            await helix_limiter.acquire()
+        try:
+            item = await items.__anext__()
+        except StopAsyncIteration:
+            return
+        count += 1
+        yield item
+
+async def resolve_logins(logins) -> Dict[str, str]:
+    """Resolve Twitch logins to user IDs, asking Helix for up to 100 logins per request"""
+    logins = list(logins)
+    user_ids = {}
+    for i in range(0, len(logins), 100):
+        async for user in helix_pages(twitch.get_users(logins=logins[i:i + 100])):
+            user_ids[user.login.lower()] = user.id
+    return user_ids
+
 async def get_channel_id(channel_name):
+    """Resolve a lowercase Twitch login to its user ID"""
+    global channel_id_cache
+    if channel_id_cache:
+        return channel_id_cache
+
     try:
-        logger.info(f"Getting channel ID for: {channel_name}")
-        users = twitch.get_users(logins=[channel_name])
-        
-        async for user in users:
-            if user.login.lower() == channel_name.lower():
-                logger.info(f"Found channel ID: {user.id} for user: {user.login}")
-                return user.id
-        
-        logger.warning(f"No user found for channel name: {channel_name}")
-        return None
+        logger.info("Getting channel ID for: %s", channel_name)
+        user_id = (await resolve_logins([channel_name])).get(channel_name)
+        if not user_id:
+            logger.warning("No user found for channel name: %s", channel_name)
+            return None
+
+        logger.info("Found channel ID: %s for user: %s", user_id, channel_name)
+        channel_id_cache = user_id
+        return user_id
     except Exception as e:
-        logger.error(f"Error getting channel ID: {e}", exc_info=True)
+        logger.error("Error getting channel ID: %s", e, exc_info=True)
         return None
 
-async def get_vips(channel_id):
-    vips = []
+async def get_vips(channel_id) -> Optional[Set[str]]:
+    """Fetch all VIP logins, or None if Twitch couldn't be asked"""
+    global channel_id_cache
     try:
-        logger.info(f"Getting VIPs for channel ID: {channel_id}")
+        logger.info("Getting VIPs for channel ID: %s", channel_id)
         
         # Make sure we have valid authentication
         if not twitch or not hasattr(twitch, 'has_user_auth') or not twitch.has_user_auth:
-            if DISCORD_MOD_CHANNEL_ID:
-                channel = bot.get_channel(DISCORD_MOD_CHANNEL_ID)
-                if channel:
-                    await channel.send("⚠️ Je potřeba obnovit Twitch autorizaci! Použij příkaz `!setupauth`")
-            return []
+            await notify_auth_missing()
+            return None
         
         try:
-            # Get VIPs with proper await
-            vips_data = await twitch.get_vips(broadcaster_id=channel_id)
-            if isinstance(vips_data, list):
-                for vip in vips_data:
-                    vips.append(vip.user_login.lower())
-            logger.info(f"Found {len(vips)} VIPs")
+            # Page through all VIPs using the largest page size Twitch allows
+            vips = {
+                vip.user_login.lower()
+                async for vip in helix_pages(twitch.get_vips(broadcaster_id=channel_id, first=100))
+            }
+            logger.info("Found %d VIPs", len(vips))
+            return vips
         except Exception as api_error:
-            logger.error(f"API Error getting VIPs: {api_error}")
+            logger.error("API Error getting VIPs: %s", api_error)
+            if isinstance(api_error, (UnauthorizedException, TwitchResourceNotFound)):
+                # Resolve the channel again next time in case the cached ID went stale
+                channel_id_cache = None
             if "require user authentication" in str(api_error):
-                if DISCORD_MOD_CHANNEL_ID:
-                    channel = bot.get_channel(DISCORD_MOD_CHANNEL_ID)
-                    if channel:
-                        await channel.send("⚠️ Je potřeba obnovit Twitch autorizaci! Použij příkaz `!setupauth`")
-        
-        return vips
+                await notify_auth_missing()
+            return None
         
     except Exception as e:
-        logger.error(f"Error getting VIPs: {e}", exc_info=True)
-        return []
+        logger.error("Error getting VIPs: %s", e, exc_info=True)
+        return None
 
-async def get_subscribers(channel_id):
-    subscribers = []
+async def get_subscribers(channel_id) -> Optional[Set[str]]:
+    """Fetch all subscriber logins, or None if Twitch couldn't be asked"""
+    global channel_id_cache
     try:
-        logger.info(f"Getting subscribers for channel ID: {channel_id}")
+        logger.info("Getting subscribers for channel ID: %s", channel_id)
         
         # Make sure we have valid authentication
         if not twitch or not hasattr(twitch, 'has_user_auth') or not twitch.has_user_auth:
-            if DISCORD_MOD_CHANNEL_ID:
-                channel = bot.get_channel(DISCORD_MOD_CHANNEL_ID)
-                if channel:
-                    await channel.send("⚠️ Je potřeba obnovit Twitch autorizaci! Použij příkaz `!setupauth`")
-            return []
+            await notify_auth_missing()
+            return None
         
         try:
-            # Get subscribers with proper await
-            subs_data = await twitch.get_broadcaster_subscriptions(broadcaster_id=channel_id)
-            if isinstance(subs_data, list):
-                for sub in subs_data:
-                    subscribers.append(sub.user_login.lower())
-            logger.info(f"Found {len(subscribers)} subscribers")
+            # Page through all subscribers using the largest page size Twitch allows
+            # The first page is already requested here, not by the iterator
+            async with helix_limiter:
+                subs_data = await twitch.get_broadcaster_subscriptions(broadcaster_id=channel_id, first=100)
+            subscribers = {sub.user_login.lower() async for sub in helix_pages(subs_data, first_page_loaded=True)}
+            logger.info("Found %d subscribers", len(subscribers))
+            return subscribers
         except Exception as api_error:
-            logger.error(f"API Error getting subscribers: {api_error}")
+            logger.error("API Error getting subscribers: %s", api_error)
+            if isinstance(api_error, (UnauthorizedException, TwitchResourceNotFound)):
+                # Resolve the channel again next time in case the cached ID went stale
+                channel_id_cache = None
             if "require user authentication" in str(api_error):
-                if DISCORD_MOD_CHANNEL_ID:
-                    channel = bot.get_channel(DISCORD_MOD_CHANNEL_ID)
-                    if channel:
-                        await channel.send("⚠️ Je potřeba obnovit Twitch autorizaci! Použij příkaz `!setupauth`")
-        
-        return subscribers
+                await notify_auth_missing()
+            return None
         
     except Exception as e:
-        logger.error(f"Error getting subscribers: {e}", exc_info=True)
-        return []
+        logger.error("Error getting subscribers: %s", e, exc_info=True)
+        return None
+
+async def get_cached_twitch_set(key, fetch, channel_id, force=False) -> Optional[Set[str]]:
+    async with twitch_cache_locks[key]:
+        fetched_at, values = twitch_cache[key]
+        ttl = EVENTSUB_CACHE_TTL if eventsub else TWITCH_CACHE_TTL
+        if not force and fetched_at is not None and time.monotonic() - fetched_at < ttl:
+            return values
+
+        values = await fetch(channel_id)
+        # A failed fetch is never cached, an empty set would strip everyone's roles
+        if values is not None:
+            twitch_cache[key] = (time.monotonic(), values)
+        return values
+
+async def get_cached_vips(channel_id, force=False) -> Optional[Set[str]]:
+    return await get_cached_twitch_set('vips', get_vips, channel_id, force)
+
+async def get_cached_subscribers(channel_id, force=False) -> Optional[Set[str]]:
+    return await get_cached_twitch_set('subs', get_subscribers, channel_id, force)
+
+async def get_members(guild, discord_ids):
+    """Resolve members from the guild cache, querying the gateway in batches for any misses"""
+    members = {}
+    missing = []
+    for discord_id in discord_ids:
+        member = guild.get_member(discord_id)
+        if member:
+            members[discord_id] = member
+        else:
+            missing.append(discord_id)
+
+    for i in range(0, len(missing), 100):
+        batch = missing[i:i + 100]
+        try:
+            for member in await guild.query_members(user_ids=batch, limit=100, cache=True):
+                members[member.id] = member
+        except Exception as e:
+            logger.error("Error querying members: %s", e)
+
+    return members
+
+async def set_member_roles(member, added, removed):
+    """Apply role changes to a member, using a single edit when more than one role changes"""
+    retries = 0
+    while True:
+        try:
+            if len(added) + len(removed) > 1:
+                # roles[0] is @everyone, which can't be part of the edit
+                roles = [role for role in member.roles[1:] if role not in removed]
+                await member.edit(roles=roles + added)
+            elif added:
+                await member.add_roles(*added)
+            else:
+                await member.remove_roles(*removed)
+            for role in added:
+                logger.info("Added %s role to %s", role.name, member.name)
+            for role in removed:
+                logger.info("Removed %s role from %s", role.name, member.name)
+            return
+        except discord.HTTPException as e:
+            if retries >= ROLE_UPDATE_RETRIES or not (e.status == 429 or 500 <= e.status < 600):
+                raise
+            if e.status == 429:
+                delay = float(e.response.headers.get('Retry-After', 1))
+            else:
+                delay = min(2 ** retries, 30)
+            retries += 1
+            logger.warning("Discord returned %s for %s, retrying in %.1fs", e.status, member.name, delay)
+            await asyncio.sleep(delay)
+
+async def set_member_role(member, role, add):
+    if add:
+        await set_member_roles(member, [role], [])
+    else:
+        await set_member_roles(member, [], [role])
+
+async def update_member_roles(semaphore, member, added, removed):
+    async with semaphore:
+        await set_member_roles(member, added, removed)
+
+async def apply_twitch_event(role_id, cache_key, user_login, add):
+    """Apply a single VIP/subscriber change pushed by EventSub"""
+    twitch_login = user_login.lower()
+    # Wait for any fetch in flight, otherwise its older result would overwrite this change
+    async with twitch_cache_locks[cache_key]:
+        cached = twitch_cache[cache_key][1]
+        if add:
+            cached.add(twitch_login)
+        else:
+            cached.discard(twitch_login)
+
+    discord_ids = twitch_to_discord.get(twitch_login)
+    if not discord_ids:
+        return
+
+    guild = bot.get_guild(DISCORD_GUILD_ID)
+    role = guild.get_role(role_id) if guild else None
+    if not role:
+        return
+
+    members = await get_members(guild, list(discord_ids))
+    for member in members.values():
+        if (role in member.roles) != add:
+            try:
+                await set_member_role(member, role, add)
+            except Exception as e:
+                logger.error("Error processing member %s: %s", member.id, e)
+
+async def reconcile_member(discord_id, twitch_username=None):
+    """Update the VIP/SUB roles of one member, removing both when they have no linked account
+
+    Returns False if the roles could not be brought up to date.
+    """
+    guild = bot.get_guild(DISCORD_GUILD_ID)
+    if not guild:
+        return False
+
+    role_targets = [(guild.get_role(DISCORD_VIP_ROLE_ID), get_cached_vips)]
+    if SUB_ENABLED:
+        role_targets.append((guild.get_role(DISCORD_SUB_ROLE_ID), get_cached_subscribers))
+    role_targets = [(role, fetch) for role, fetch in role_targets if role]
+
+    members = await get_members(guild, [discord_id])
+    member = members.get(discord_id)
+    if not member:
+        return False
+
+    if twitch_username is None:
+        desired = [False] * len(role_targets)
+    else:
+        if await get_twitch() is None:
+            return False
+        channel_id = await get_channel_id(TWITCH_CHANNEL_LOGIN)
+        if not channel_id:
+            return False
+        twitch_sets = await asyncio.gather(*(fetch(channel_id) for _, fetch in role_targets))
+        if any(logins is None for logins in twitch_sets):
+            return False
+        desired = [twitch_username in logins for logins in twitch_sets]
+
+    added = [role for (role, _), add in zip(role_targets, desired) if add and role not in member.roles]
+    removed = [role for (role, _), add in zip(role_targets, desired) if not add and role in member.roles]
+    if added or removed:
+        try:
+            await set_member_roles(member, added, removed)
+        except Exception as e:
+            logger.error("Error processing member %s: %s", member.id, e)
+            return False
+    return True
+
+async def on_vip_add(data):
+    await apply_twitch_event(DISCORD_VIP_ROLE_ID, 'vips', data.event.user_login, True)
+
+async def on_vip_remove(data):
+    await apply_twitch_event(DISCORD_VIP_ROLE_ID, 'vips', data.event.user_login, False)
+
+async def on_subscribe(data):
+    await apply_twitch_event(DISCORD_SUB_ROLE_ID, 'subs', data.event.user_login, True)
+
+async def on_subscription_end(data):
+    await apply_twitch_event(DISCORD_SUB_ROLE_ID, 'subs', data.event.user_login, False)
+
+async def stop_eventsub():
+    global eventsub
+    if eventsub:
+        try:
+            await eventsub.stop()
+        except Exception as e:
+            logger.error("Error stopping Twitch EventSub: %s", e)
+        eventsub = None
+
+async def start_eventsub():
+    """Listen for VIP and subscriber changes so roles update without waiting for the next sync"""
+    global eventsub
+    if eventsub or not twitch:
+        return
+
+    channel_id = await get_channel_id(TWITCH_CHANNEL_LOGIN)
+    if not channel_id:
+        return
+
+    try:
+        eventsub = EventSubWebsocket(twitch, callback_loop=asyncio.get_running_loop())
+        eventsub.start()
+        await eventsub.listen_channel_vip_add(channel_id, on_vip_add)
+        await eventsub.listen_channel_vip_remove(channel_id, on_vip_remove)
+        if SUB_ENABLED:
+            await eventsub.listen_channel_subscribe(channel_id, on_subscribe)
+            await eventsub.listen_channel_subscription_end(channel_id, on_subscription_end)
+        logger.info("Listening for Twitch VIP/subscriber events")
+    except Exception as e:
+        logger.error("Failed to start Twitch EventSub: %s", e, exc_info=True)
+        await stop_eventsub()
+
+def request_sync() -> asyncio.Future:
+    """Queue a role sync and return a future that resolves once it has run"""
+    done = asyncio.get_running_loop().create_future()
+    sync_queue.put_nowait(done)
+    return done
 
-@tasks.loop(hours=24)
-async def sync_roles_task():
+async def sync_worker():
+    """Run queued role syncs one at a time, and one every SYNC_INTERVAL when idle"""
+    while True:
+        try:
+            waiters = [await asyncio.wait_for(sync_queue.get(), timeout=SYNC_INTERVAL)]
+        except asyncio.TimeoutError:
+            waiters = []
+        # Requests that piled up while the previous sync ran are served by one run
+        while not sync_queue.empty():
+            waiters.append(sync_queue.get_nowait())
+
+        await sync_roles()
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+async def sync_roles():
+    """Bring the roles of all linked members in line with freshly fetched Twitch data"""
     try:
+        if not verified_users:
+            logger.info("No linked users, skipping role sync")
+            return
+
         logger.info("Starting role sync...")
-        global twitch
-        if twitch is None:
-            twitch = await initialize_twitch()
-            if twitch is None:
-                return
+        if await get_twitch() is None:
+            return
 
         guild = bot.get_guild(DISCORD_GUILD_ID)
         if not guild:
-            logger.error(f"Could not find guild with ID {DISCORD_GUILD_ID}")
+            logger.error("Could not find guild with ID %s", DISCORD_GUILD_ID)
             return
 
         vip_role = guild.get_role(DISCORD_VIP_ROLE_ID)
         if not vip_role:
-            logger.error(f"Could not find VIP role")
+            logger.error("Could not find VIP role")
             return
 
         sub_role = None
-        if DISCORD_SUB_ROLE_ID:
+        if SUB_ENABLED:
             sub_role = guild.get_role(DISCORD_SUB_ROLE_ID)
             if not sub_role:
-                logger.error(f"Could not find Subscriber role")
+                logger.error("Could not find Subscriber role")
 
-        channel_id = await get_channel_id(TWITCH_CHANNEL_NAME)
+        channel_id = await get_channel_id(TWITCH_CHANNEL_LOGIN)
         if not channel_id:
             return
 
-        vips = await get_vips(channel_id)
-        subscribers = await get_subscribers(channel_id) if sub_role else []
-        
-        for discord_id, twitch_username in verified_users.items():
-            try:
-                member = await guild.fetch_member(int(discord_id))
-                if not member:
-                    continue
-
-                # Handle VIP role
-                is_vip = twitch_username.lower() in vips
-                has_vip = vip_role in member.roles
-
-                if is_vip and not has_vip:
-                    await member.add_roles(vip_role)
-                    logger.info(f"Added VIP role to {member.name}")
-                elif not is_vip and has_vip:
-                    await member.remove_roles(vip_role)
-                    logger.info(f"Removed VIP role from {member.name}")
-
-                # Handle Subscriber role if configured
-                if sub_role:
-                    is_sub = twitch_username.lower() in subscribers
-                    has_sub = sub_role in member.roles
-
-                    if is_sub and not has_sub:
-                        await member.add_roles(sub_role)
-                        logger.info(f"Added Subscriber role to {member.name}")
-                    elif not is_sub and has_sub:
-                        await member.remove_roles(sub_role)
-                        logger.info(f"Removed Subscriber role from {member.name}")
+        if sub_role:
+            vips, subscribers = await asyncio.gather(
+                get_cached_vips(channel_id, force=True),
+                get_cached_subscribers(channel_id, force=True)
+            )
+        else:
+            vips, subscribers = await get_cached_vips(channel_id, force=True), set()
+        if vips is None or subscribers is None:
+            logger.error("Could not fetch VIPs/subscribers from Twitch, skipping role sync")
+            return
+        linked_ids = set(verified_users)
 
-            except Exception as e:
-                logger.error(f"Error processing member {discord_id}: {e}")
+        role_targets = [(vip_role, vips)]
+        if sub_role:
+            role_targets.append((sub_role, subscribers))
+
+        # Only touch members whose role actually has to change, grouped so each gets one request
+        pending_updates: Dict[int, tuple] = {}
+        for role, twitch_logins in role_targets:
+            # Roles given by hand to members without a linked account are left alone
+            current_ids = {member.id for member in role.members} & linked_ids
+            desired_ids = set().union(*(twitch_to_discord[login] for login in twitch_logins if login in twitch_to_discord))
+            for discord_id in desired_ids - current_ids:
+                pending_updates.setdefault(discord_id, ([], []))[0].append(role)
+            for discord_id in current_ids - desired_ids:
+                pending_updates.setdefault(discord_id, ([], []))[1].append(role)
+
+        members = await get_members(guild, pending_updates)
+        role_updates = [
+            (members[discord_id], added, removed)
+            for discord_id, (added, removed) in pending_updates.items() if discord_id in members
+        ]
+
+        semaphore = asyncio.Semaphore(ROLE_UPDATE_CONCURRENCY)
+        results = await asyncio.gather(
+            *(update_member_roles(semaphore, member, added, removed) for member, added, removed in role_updates),
+            return_exceptions=True
+        )
+        for (member, _, _), result in zip(role_updates, results):
+            if isinstance(result, Exception):
+                logger.error("Error processing member %s: %s", member.id, result)
 
     except Exception as e:
-        logger.error(f"Error in sync_roles_task: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error in sync_roles: %s", e)
 
 @bot.event
 async def on_ready():
-    global twitch
-    logger.info(f"Bot connected as {bot.user.name}")
-    load_verified_users()
-    twitch = await initialize_twitch()
-    if twitch:
-        sync_roles_task.start()
-        logger.info("Role sync task started")
+    global sync_worker_task
+    logger.info("Bot connected as %s", bot.user.name)
+    guild = bot.get_guild(DISCORD_GUILD_ID)
+    if guild and not guild.chunked:
+        await guild.chunk(cache=True)
+    first_start = sync_worker_task is None
+    if sync_worker_task is None or sync_worker_task.done():
+        sync_worker_task = asyncio.create_task(sync_worker())
+        logger.info("Role sync worker started")
+    if await get_twitch():
+        if first_start:
+            request_sync()
+        await start_eventsub()
     else:
         logger.error("Failed to initialize Twitch API on startup")
 
+# Static !setupauth responses, built once
+SETUP_AUTH_STATUS_EMBED = discord.Embed(
+    title="🔄 Inicializace Twitch autentizace",
+    description="```diff\n+ Generuji bezpečný autentizační odkaz...\n```",
+    color=0x9147ff  # Twitch purple
+)
+SETUP_AUTH_URL_ERROR_EMBED = discord.Embed(
+    title="❌ Chyba při generování",
+    description=(
+        "```diff\n- Nepodařilo se vygenerovat autentizační odkaz\n```\n"
+        "**Možné příčiny:**\n"
+        "• Problém s připojením k Twitch API\n"
+        "• Neplatné přihlašovací údaje\n"
+        "• Dočasná nedostupnost služby"
+    ),
+    color=discord.Color.red()
+)
+SETUP_AUTH_ERROR_EMBED = discord.Embed(
+    title="⚠️ Systémová chyba",
+    description="```diff\n- Nastala neočekávaná chyba\n```\nProsím, kontaktujte administrátora.",
+    color=discord.Color.red()
+)
+
 @bot.command(name='setupauth')
 @commands.has_permissions(administrator=True)
 async def setup_auth(ctx):
@@ -267,12 +680,7 @@ async def setup_auth(ctx):
             await auth_manager.initialize()
         
         # Send initial status message
-        initial_embed = discord.Embed(
-            title="🔄 Inicializace Twitch autentizace",
-            description="```diff\n+ Generuji bezpečný autentizační odkaz...\n```",
-            color=0x9147ff  # Twitch purple
-        )
-        setup_msg = await ctx.send(embed=initial_embed)
+        setup_msg = await ctx.send(embed=SETUP_AUTH_STATUS_EMBED)
         
         # Get authentication URL
         auth_url = await auth_manager.generate_auth_url()
@@ -292,28 +700,46 @@ async def setup_auth(ctx):
             )
             await setup_msg.edit(embed=auth_embed)
         else:
-            error_embed = discord.Embed(
-                title="❌ Chyba při generování",
-                description=(
-                    "```diff\n- Nepodařilo se vygenerovat autentizační odkaz\n```\n"
-                    "**Možné příčiny:**\n"
-                    "• Problém s připojením k Twitch API\n"
-                    "• Neplatné přihlašovací údaje\n"
-                    "• Dočasná nedostupnost služby"
-                ),
-                color=discord.Color.red()
-            )
-            await setup_msg.edit(embed=error_embed)
+            await setup_msg.edit(embed=SETUP_AUTH_URL_ERROR_EMBED)
             
     except Exception as e:
-        logger.error(f"Error in setup_auth: {e}")
-        await ctx.send(
-            embed=discord.Embed(
-                title="⚠️ Systémová chyba",
-                description="```diff\n- Nastala neočekávaná chyba\n```\nProsím, kontaktujte administrátora.",
-                color=discord.Color.red()
-            )
-        )
+        logger.error("Error in setup_auth: %s", e)
+        await ctx.send(embed=SETUP_AUTH_ERROR_EMBED)
+
+# Static !completeauth responses, built once
+COMPLETE_AUTH_STATUS_EMBED = discord.Embed(
+    title="🔄 Zpracování autentizace",
+    description="```yaml\nProbíhá ověření a nastavení...\n```",
+    color=0x9147ff
+)
+COMPLETE_AUTH_SUCCESS_EMBED = discord.Embed(
+    title="✅ Autentizace úspěšná",
+    description=(
+        "```diff\n+ Twitch autentizace byla úspěšně dokončena!\n```\n"
+        "**Provedené akce:**\n"
+        "• Ověření autentizačního kódu\n"
+        "• Nastavení Twitch API\n"
+        "• Aktivace synchronizace rolí"
+    ),
+    color=discord.Color.green()
+)
+COMPLETE_AUTH_FAILED_EMBED = discord.Embed(
+    title="❌ Chyba autentizace",
+    description=(
+        "```diff\n- Nepodařilo se dokončit autentizaci\n```\n"
+        "**Možné příčiny:**\n"
+        "• Neplatný nebo expirovaný kód\n"
+        "• Chyba při komunikaci s Twitch API\n"
+        "• Nedostatečná oprávnění\n\n"
+        "Prosím, vygenerujte nový autentizační odkaz pomocí `!setupauth`"
+    ),
+    color=discord.Color.red()
+)
+COMPLETE_AUTH_ERROR_EMBED = discord.Embed(
+    title="⚠️ Chyba při autentizaci",
+    description="```diff\n- Nastala neočekávaná chyba při dokončování autentizace\n```",
+    color=discord.Color.red()
+)
 
 @bot.command(name='completeauth')
 @commands.has_permissions(administrator=True)
@@ -323,85 +749,90 @@ async def complete_auth(ctx, auth_code: str):
         await ctx.message.delete()  # Delete the message containing the auth code
         
         # Send initial status
-        status_embed = discord.Embed(
-            title="🔄 Zpracování autentizace",
-            description="```yaml\nProbíhá ověření a nastavení...\n```",
-            color=0x9147ff
-        )
-        status_msg = await ctx.send(embed=status_embed)
+        status_msg = await ctx.send(embed=COMPLETE_AUTH_STATUS_EMBED)
         
-        global auth_manager, twitch
+        global auth_manager, twitch, last_auth_notify, channel_id_cache
         if not auth_manager:
             auth_manager = TwitchAuthManager(TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET, TWITCH_CHANNEL_NAME)
             await auth_manager.initialize()
+        # Keep using this manager even if the global one changes while we wait on Twitch
+        manager = auth_manager
             
-        if await auth_manager.set_user_auth(auth_code):
-            twitch = auth_manager.twitch
-            success_embed = discord.Embed(
-                title="✅ Autentizace úspěšná",
-                description=(
-                    "```diff\n+ Twitch autentizace byla úspěšně dokončena!\n```\n"
-                    "**Provedené akce:**\n"
-                    "• Ověření autentizačního kódu\n"
-                    "• Nastavení Twitch API\n"
-                    "• Aktivace synchronizace rolí"
-                ),
-                color=discord.Color.green()
-            )
+        if await manager.set_user_auth(auth_code):
+            if twitch and twitch is not manager.twitch:
+                # EventSub is bound to the old client, so restart it with the new one
+                await stop_eventsub()
+                await twitch.close()
+            twitch = manager.twitch
+            # A later auth problem should be reported right away
+            last_auth_notify = 0.0
+            # Resolve the channel again with the new credentials
+            channel_id_cache = None
+            await start_eventsub()
+            request_sync()
+            success_embed = COMPLETE_AUTH_SUCCESS_EMBED.copy()
             success_embed.set_footer(text=f"Dokončeno • {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
             await status_msg.edit(embed=success_embed)
         else:
-            error_embed = discord.Embed(
-                title="❌ Chyba autentizace",
-                description=(
-                    "```diff\n- Nepodařilo se dokončit autentizaci\n```\n"
-                    "**Možné příčiny:**\n"
-                    "• Neplatný nebo expirovaný kód\n"
-                    "• Chyba při komunikaci s Twitch API\n"
-                    "• Nedostatečná oprávnění\n\n"
-                    "Prosím, vygenerujte nový autentizační odkaz pomocí `!setupauth`"
-                ),
-                color=discord.Color.red()
-            )
-            await status_msg.edit(embed=error_embed)
+            await status_msg.edit(embed=COMPLETE_AUTH_FAILED_EMBED)
     except Exception as e:
-        logger.error(f"Error in complete_auth: {e}")
-        await ctx.send(
-            embed=discord.Embed(
-                title="⚠️ Chyba při autentizaci",
-                description="```diff\n- Nastala neočekávaná chyba při dokončování autentizace\n```",
-                color=discord.Color.red()
-            )
-        )
+        logger.error("Error in complete_auth: %s", e)
+        await ctx.send(embed=COMPLETE_AUTH_ERROR_EMBED)
+
+# Static !link responses, built once
+LINK_MISSING_USERNAME_EMBED = discord.Embed(
+    title="❌ Chybí uživatelské jméno",
+    description="```diff\n- Prosím zadej svoje Twitch uživatelské jméno\n```\n**Použití:**\n`!link <twitch_username>`",
+    color=discord.Color.red()
+)
+LINK_STATUS_EMBED = discord.Embed(
+    title="🔄 Probíhá propojení účtů",
+    description="```yaml\nUkládám propojení účtů...\n```",
+    color=0x9147ff
+)
+LINK_ERROR_EMBED = discord.Embed(
+    title="❌ Chyba při propojování",
+    description="```diff\n- Nastala chyba při propojování účtů\n```",
+    color=discord.Color.red()
+)
 
 @bot.command(name='link')
 async def link_account(ctx, twitch_username: str = None):
     """Link Discord account with Twitch account"""
     if not twitch_username:
-        await ctx.send(
-            embed=discord.Embed(
-                title="❌ Chybí uživatelské jméno",
-                description="```diff\n- Prosím zadej svoje Twitch uživatelské jméno\n```\n**Použití:**\n`!link <twitch_username>`",
-                color=discord.Color.red()
-            )
-        )
+        await ctx.send(embed=LINK_MISSING_USERNAME_EMBED)
         return
 
     twitch_username = twitch_username.lower()
-    discord_id = str(ctx.author.id)
+    discord_id = ctx.author.id
     
     # Send initial status
-    status_embed = discord.Embed(
-        title="🔄 Probíhá propojení účtů",
-        description="```yaml\nUkládám propojení účtů...\n```",
-        color=0x9147ff
-    )
-    status_msg = await ctx.send(embed=status_embed)
+    status_msg = await ctx.send(embed=LINK_STATUS_EMBED)
     
     try:
-        verified_users[discord_id] = twitch_username
-        save_verified_users()
+        # Reject logins that don't exist so they never end up in every sync
+        client = await get_twitch()
+        if client:
+            twitch_user = await first(helix_pages(client.get_users(logins=[twitch_username])))
+            if not twitch_user:
+                not_found_embed = discord.Embed(
+                    title="❌ Twitch účet nenalezen",
+                    description=(
+                        f"```diff\n- Twitch účet {twitch_username} neexistuje\n```\n"
+                        "Zkontroluj uživatelské jméno a zkus to znovu."
+                    ),
+                    color=discord.Color.red()
+                )
+                await status_msg.edit(embed=not_found_embed)
+                return
+            twitch_username = twitch_user.login.lower()
+
+        await link_verified_user(discord_id, twitch_username)
         
+        if await reconcile_member(discord_id, twitch_username):
+            roles_status = "• VIP/SUB role byly nastaveny podle tvého Twitch účtu\n"
+        else:
+            roles_status = "• VIP/SUB role se nastaví při příští synchronizaci\n"
         success_embed = discord.Embed(
             title="✅ Účty úspěšně propojeny",
             description=(
@@ -410,42 +841,56 @@ async def link_account(ctx, twitch_username: str = None):
                 f"**Discord účet:** {ctx.author.mention}\n\n"
                 "**Další kroky:**\n"
                 "• Použij `!check` pro kontrolu statusu rolí\n"
-                "• Role se synchronizují automaticky každých 24 hodin\n"
+                f"{roles_status}"
+                "• Další změny na Twitchi se promítnou automaticky\n"
                 "• Administrátor může vynutit okamžitou synchronizaci"
             ),
             color=discord.Color.green()
         )
         success_embed.set_footer(text=f"Propojeno • {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
         await status_msg.edit(embed=success_embed)
-        await sync_roles_task()
         
     except Exception as e:
-        logger.error(f"Error in link_account: {e}")
-        error_embed = discord.Embed(
-            title="❌ Chyba při propojování",
-            description="```diff\n- Nastala chyba při propojování účtů\n```",
-            color=discord.Color.red()
-        )
-        await status_msg.edit(embed=error_embed)
+        logger.error("Error in link_account: %s", e)
+        await status_msg.edit(embed=LINK_ERROR_EMBED)
+
+# Static !unlink responses, built once
+UNLINK_STATUS_EMBED = discord.Embed(
+    title="🔄 Kontrola propojení",
+    description="```yaml\nKontroluji propojení účtů...\n```",
+    color=0x9147ff
+)
+UNLINK_NOT_LINKED_EMBED = discord.Embed(
+    title="❌ Účet není propojen",
+    description=(
+        "```diff\n- Tvůj Discord účet není propojen s žádným Twitch účtem\n```\n"
+        "**Jak propojit účty:**\n"
+        "• Použij příkaz `!link <twitch_username>`\n"
+        "• Po propojení použij `!check` pro kontrolu"
+    ),
+    color=discord.Color.red()
+)
+UNLINK_ERROR_EMBED = discord.Embed(
+    title="⚠️ Chyba při odpojování",
+    description="```diff\n- Nastala neočekávaná chyba při odpojování účtů\n```",
+    color=discord.Color.red()
+)
 
 @bot.command(name='unlink')
 async def unlink_account(ctx):
     """Unlink Discord account from Twitch account"""
-    discord_id = str(ctx.author.id)
+    discord_id = ctx.author.id
     
-    status_embed = discord.Embed(
-        title="🔄 Kontrola propojení",
-        description="```yaml\nKontroluji propojení účtů...\n```",
-        color=0x9147ff
-    )
-    status_msg = await ctx.send(embed=status_embed)
+    status_msg = await ctx.send(embed=UNLINK_STATUS_EMBED)
     
     try:
-        if discord_id in verified_users:
-            twitch_username = verified_users[discord_id]
-            del verified_users[discord_id]
-            save_verified_users()
-            
+        twitch_username = await unlink_verified_user(discord_id)
+        if twitch_username is not None:
+            # The role sync leaves unlinked members alone, so there is no later retry to promise
+            if await reconcile_member(discord_id):
+                roles_status = "• VIP/SUB role byly odebrány\n"
+            else:
+                roles_status = "• VIP/SUB role se nepodařilo odebrat, požádej administrátora\n"
             success_embed = discord.Embed(
                 title="✅ Účty odpojeny",
                 description=(
@@ -453,101 +898,80 @@ async def unlink_account(ctx):
                     f"**Odpojený Twitch účet:** `{twitch_username}`\n"
                     f"**Discord účet:** {ctx.author.mention}\n\n"
                     "**Info:**\n"
-                    "• VIP/SUB role budou odebrány při příští synchronizaci\n"
+                    f"{roles_status}"
                     "• Pro opětovné propojení použij `!link <twitch_username>`"
                 ),
                 color=discord.Color.green()
             )
             success_embed.set_footer(text=f"Odpojeno • {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
             await status_msg.edit(embed=success_embed)
-            await sync_roles_task()
         else:
-            not_linked_embed = discord.Embed(
-                title="❌ Účet není propojen",
-                description=(
-                    "```diff\n- Tvůj Discord účet není propojen s žádným Twitch účtem\n```\n"
-                    "**Jak propojit účty:**\n"
-                    "• Použij příkaz `!link <twitch_username>`\n"
-                    "• Po propojení použij `!check` pro kontrolu"
-                ),
-                color=discord.Color.red()
-            )
-            await status_msg.edit(embed=not_linked_embed)
+            await status_msg.edit(embed=UNLINK_NOT_LINKED_EMBED)
             
     except Exception as e:
-        logger.error(f"Error in unlink_account: {e}")
-        error_embed = discord.Embed(
-            title="⚠️ Chyba při odpojování",
-            description="```diff\n- Nastala neočekávaná chyba při odpojování účtů\n```",
-            color=discord.Color.red()
-        )
-        await status_msg.edit(embed=error_embed)
+        logger.error("Error in unlink_account: %s", e)
+        await status_msg.edit(embed=UNLINK_ERROR_EMBED)
+
+def status_values(subject):
+    return {True: f"✅ Máš {subject}", False: f"❌ Nemáš {subject}"}
+
+# Static parts of the !check response, built once
+CHECK_NOT_LINKED_EMBED = discord.Embed(
+    title="❌ Účet není propojen",
+    description="Tvůj Discord účet není propojen s žádným Twitch účtem.\nPoužij `!link <twitch_username>` pro propojení účtů.",
+    color=discord.Color.red()
+)
+CHECK_STATUS_EMBED = discord.Embed(title="📊 Status účtu", color=discord.Color.blue())
+TWITCH_VIP_STATUS = status_values(f"VIP na kanále {TWITCH_CHANNEL_NAME}")
+TWITCH_SUB_STATUS = status_values(f"SUB na kanále {TWITCH_CHANNEL_NAME}")
+DISCORD_VIP_STATUS = status_values("VIP roli na Discordu")
+DISCORD_SUB_STATUS = status_values("SUB roli na Discordu")
 
 @bot.command(name='check')
 async def check_status(ctx):
-    discord_id = str(ctx.author.id)
+    discord_id = ctx.author.id
     
-    if discord_id not in verified_users:
-        embed = discord.Embed(
-            title="❌ Účet není propojen",
-            description="Tvůj Discord účet není propojen s žádným Twitch účtem.\nPoužij `!link <twitch_username>` pro propojení účtů.",
-            color=discord.Color.red()
-        )
-        await ctx.send(embed=embed)
+    twitch_username = verified_users.get(discord_id)
+    if twitch_username is None:
+        await ctx.send(embed=CHECK_NOT_LINKED_EMBED)
         return
 
-    twitch_username = verified_users[discord_id]
-    embed = discord.Embed(
-        title="📊 Status účtu",
-        description=f"Discord účet je propojen s Twitch účtem: **{twitch_username}**",
-        color=discord.Color.blue()
-    )
+    embed = CHECK_STATUS_EMBED.copy()
+    embed.description = f"Discord účet je propojen s Twitch účtem: **{twitch_username}**"
 
     # Check Twitch status
-    channel_id = await get_channel_id(TWITCH_CHANNEL_NAME)
+    channel_id = await get_channel_id(TWITCH_CHANNEL_LOGIN)
     if channel_id:
-        vips = await get_vips(channel_id)
-        is_vip_twitch = twitch_username.lower() in vips
-        embed.add_field(
-            name="Twitch VIP Status",
-            value=f"{'✅' if is_vip_twitch else '❌'} {'Máš' if is_vip_twitch else 'Nemáš'} VIP na kanále {TWITCH_CHANNEL_NAME}",
-            inline=False
-        )
-
-        if DISCORD_SUB_ROLE_ID:
-            subscribers = await get_subscribers(channel_id)
-            is_sub_twitch = twitch_username.lower() in subscribers
-            embed.add_field(
-                name="Twitch SUB Status",
-                value=f"{'✅' if is_sub_twitch else '❌'} {'Máš' if is_sub_twitch else 'Nemáš'} SUB na kanále {TWITCH_CHANNEL_NAME}",
-                inline=False
+        if SUB_ENABLED:
+            vips, subscribers = await asyncio.gather(
+                get_cached_vips(channel_id),
+                get_cached_subscribers(channel_id)
             )
+        else:
+            vips = await get_cached_vips(channel_id)
+        if vips is not None:
+            is_vip_twitch = twitch_username in vips
+            embed.add_field(name="Twitch VIP Status", value=TWITCH_VIP_STATUS[is_vip_twitch], inline=False)
+
+        if SUB_ENABLED and subscribers is not None:
+            is_sub_twitch = twitch_username in subscribers
+            embed.add_field(name="Twitch SUB Status", value=TWITCH_SUB_STATUS[is_sub_twitch], inline=False)
 
     # Check Discord roles
     guild = ctx.guild
     vip_role = guild.get_role(DISCORD_VIP_ROLE_ID)
     has_vip_discord = vip_role in ctx.author.roles
-    embed.add_field(
-        name="Discord VIP Status",
-        value=f"{'✅' if has_vip_discord else '❌'} {'Máš' if has_vip_discord else 'Nemáš'} VIP roli na Discordu",
-        inline=False
-    )
+    embed.add_field(name="Discord VIP Status", value=DISCORD_VIP_STATUS[has_vip_discord], inline=False)
 
-    if DISCORD_SUB_ROLE_ID:
+    if SUB_ENABLED:
         sub_role = guild.get_role(DISCORD_SUB_ROLE_ID)
-        has_sub_discord = sub_role and sub_role in ctx.author.roles
-        embed.add_field(
-            name="Discord SUB Status",
-            value=f"{'✅' if has_sub_discord else '❌'} {'Máš' if has_sub_discord else 'Nemáš'} SUB roli na Discordu",
-            inline=False
-        )
+        has_sub_discord = sub_role is not None and sub_role in ctx.author.roles
+        embed.add_field(name="Discord SUB Status", value=DISCORD_SUB_STATUS[has_sub_discord], inline=False)
 
     embed.set_footer(text=f"Poslední kontrola: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
     await ctx.send(embed=embed)
 
-@bot.command(name='commands')
-async def show_commands(ctx):
-    """Show all available commands"""
+def build_commands_embed(include_admin):
     embed = discord.Embed(
         title="📋 Dostupné příkazy",
         description="Seznam všech dostupných příkazů:",
@@ -564,16 +988,29 @@ async def show_commands(ctx):
     embed.add_field(name="👥 Základní příkazy", value="\n".join(basic_commands), inline=False)
     
     # Admin commands
-    if ctx.author.guild_permissions.administrator:
+    if include_admin:
         admin_commands = [
             "`!forcesync` - Vynutí synchronizaci rolí pro všechny propojené účty",
             "`!setupauth` - Vygeneruje autentizační odkaz pro Twitch",
-            "`!completeauth <code>` - Dokončí Twitch autentizaci pomocí kódem"
+            "`!completeauth <code>` - Dokončí Twitch autentizaci pomocí kódem",
+            "`!refreshid` - Znovu načte ID Twitch kanálu z Twitch API"
         ]
         embed.add_field(name="⚡ Administrátorské příkazy", value="\n".join(admin_commands), inline=False)
     
-    embed.set_footer(text=f"Bot created by Wolf1no")
-    await ctx.send(embed=embed)
+    embed.set_footer(text="Bot created by Wolf1no")
+    return embed
+
+# The command list never changes, so both variants are built once
+COMMANDS_EMBED = build_commands_embed(include_admin=False)
+ADMIN_COMMANDS_EMBED = build_commands_embed(include_admin=True)
+
+@bot.command(name='commands')
+async def show_commands(ctx):
+    """Show all available commands"""
+    if ctx.author.guild_permissions.administrator:
+        await ctx.send(embed=ADMIN_COMMANDS_EMBED)
+    else:
+        await ctx.send(embed=COMMANDS_EMBED)
 
 
 @bot.command(name='forcesync')
@@ -587,21 +1024,40 @@ async def force_sync(ctx):
     message = await ctx.send(embed=embed)
     
     try:
-        await sync_roles_task()
+        await request_sync()
         embed.description = "✅ Synchronizace dokončena!"
         embed.color = discord.Color.green()
         logger.info("Force sync completed successfully")
     except Exception as e:
         embed.description = f"❌ Chyba při synchronizaci: {str(e)}"
         embed.color = discord.Color.red()
-        logger.error(f"Error in force_sync: {e}", exc_info=True)
+        logger.error("Error in force_sync: %s", e, exc_info=True)
     
     await message.edit(embed=embed)
 
-@sync_roles_task.before_loop
-async def before_sync_roles():
-    await bot.wait_until_ready()
-    logger.info("Role sync task is ready to start")
+@bot.command(name='refreshid')
+@commands.has_permissions(administrator=True)
+async def refresh_channel_id(ctx):
+    """Resolve the Twitch channel ID again, keeping the cached one if the lookup fails"""
+    global channel_id_cache
+    if await get_twitch() is None:
+        await ctx.send("❌ Twitch API není připojeno. Použij příkaz `!setupauth`")
+        return
+
+    try:
+        channel_id = (await resolve_logins([TWITCH_CHANNEL_LOGIN])).get(TWITCH_CHANNEL_LOGIN)
+    except Exception as e:
+        logger.error("Error refreshing channel ID: %s", e, exc_info=True)
+        channel_id = None
+    if not channel_id:
+        await ctx.send(f"❌ Twitch kanál `{TWITCH_CHANNEL_LOGIN}` nebyl nalezen, ponechávám původní ID")
+        return
+
+    channel_id_cache = channel_id
+    # EventSub subscriptions are bound to the old ID
+    await stop_eventsub()
+    await start_eventsub()
+    await ctx.send(f"✅ ID Twitch kanálu `{TWITCH_CHANNEL_LOGIN}`: `{channel_id}`")
 
 # Error handler for common exceptions
 @bot.event
@@ -611,12 +1067,19 @@ async def on_command_error(ctx, error):
     elif isinstance(error, commands.MissingRequiredArgument):
         await ctx.send("❌ Chybí povinný argument! Použij `!commands` pro nápovědu.")
     else:
-        logger.error(f"Unexpected error: {error}", exc_info=True)
+        logger.error("Unexpected error: %s", error, exc_info=True)
         await ctx.send("❌ Nastala neočekávaná chyba. Prosím, zkus to znovu později.")
 
 if __name__ == "__main__":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
     try:
         logger.info("Starting bot...")
-        bot.run(DISCORD_TOKEN)
+        # Logging is configured above, don't let discord.py install its own handler
+        bot.run(DISCORD_TOKEN, log_handler=None)
     except Exception as e:
-        logger.error(f"Failed to start bot: {e}", exc_info=True)
+        logger.error("Failed to start bot: %s", e, exc_info=True)
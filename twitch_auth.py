@@ -43,7 +43,7 @@ class TwitchAuthManager:
             return url
             
         except Exception as e:
-            logger.error(f"Error generating auth URL: {e}")
+            logger.error("Error generating auth URL: %s", e)
             return None
 
     async def set_user_auth(self, auth_code):
@@ -75,5 +75,5 @@ class TwitchAuthManager:
             return True
 
         except Exception as e:
-            logger.error(f"Error setting user auth: {e}")
+            logger.error("Error setting user auth: %s", e)
             return False